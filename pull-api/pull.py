@@ -1,11 +1,46 @@
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import os
 import yaml
-from datetime import datetime
+from dataclasses import dataclass
 import threading
-from pathlib import Path
 import concurrent.futures
+import collections
+import copy
+import hashlib
+import heapq
+
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
+_WRITE_CHUNK = 256 * 1024
+_IMG_EXTS = frozenset(('jpg', 'jpeg', 'png'))
+_BATCH_WINDOW = 0.05  # Kameras, die innerhalb dieses Fensters fällig werden, gemeinsam abfragen
+_SAFE_MAP = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'Ä': 'ae', 'Ö': 'oe', 'Ü': 'ue', ' ': '_'})
+
+# Pfad -> (st_mtime_ns, st_size, blake2b-Digest, config) der zuletzt geparsten Konfiguration
+_yaml_cache = {}
+
+def _is_image_name(name):
+    """Prüft die Dateiendung ohne den ganzen Namen klein zu schreiben"""
+    _, dot, ext = name.rpartition('.')
+    return bool(dot) and ext.lower() in _IMG_EXTS
+
+@dataclass(slots=True)
+class CameraCtx:
+    """Einmalig aufgelöste Einstellungen einer Kamera für den Download-Pfad"""
+    name: str
+    url: str
+    folder: str
+    max_images: int
+    timeout: float
+    interval: float
+    safe_name: str
+    last_etag: str = None
+    last_modified: str = None
 
 class MultiCameraDownloader:
     def __init__(self, config_file="config.yaml"):
@@ -18,17 +53,41 @@ class MultiCameraDownloader:
         self.config_file = config_file
         self.config = self._load_config()
         self.running = False
-        self.download_threads = []
+        self.scheduler_thread = None
+        self._stop_event = threading.Event()
+        self._ctxs = []
+        self._ctxs_by_name = {}
+        self._session = self._create_session()
+        # Ein Pool für die gesamte Laufzeit - genutzt vom Scheduler und von download_single_all
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(32, max(4, len(self.config['cameras']))),
+            thread_name_prefix='cam-dl'
+        )
+        self._recent = {}  # Kamera-Ordner -> deque der gespeicherten Bilder (älteste zuerst)
         
         self._create_directories()
     
     def _load_config(self):
-        """Lädt die Konfiguration aus der YAML-Datei"""
+        """Lädt die Konfiguration aus der YAML-Datei (unveränderte Dateien aus dem Cache)"""
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as file:
-                config = yaml.safe_load(file)
+            st = os.stat(self.config_file)
+            cached = _yaml_cache.get(self.config_file)
+            if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                return copy.deepcopy(cached[3])
+            
+            with open(self.config_file, 'rb') as file:
+                buf = file.read()
+            
+            # Nur angefasst (z.B. touch), aber inhaltlich gleich: Parsen und Validieren sparen
+            digest = hashlib.blake2b(buf, digest_size=16).digest()
+            if cached and cached[2] == digest:
+                config = cached[3]
+            else:
+                config = yaml.load(buf, Loader=_YamlLoader)
                 self._validate_config(config)
-                return config
+            
+            _yaml_cache[self.config_file] = (st.st_mtime_ns, st.st_size, digest, config)
+            return copy.deepcopy(config)
         except FileNotFoundError:
             print(f"Konfigurationsdatei '{self.config_file}' nicht gefunden. Erstelle Beispiel-Konfiguration...")
             self._create_example_config()
@@ -54,11 +113,12 @@ class MultiCameraDownloader:
         if len(config['cameras']) == 0:
             raise ValueError("Mindestens eine Kamera muss konfiguriert sein")
         
-        for i, camera in enumerate(config['cameras']):
-            if 'name' not in camera:
-                raise ValueError(f"Kamera {i+1}: 'name' fehlt")
-            if 'ip' not in camera:
-                raise ValueError(f"Kamera {i+1}: 'ip' fehlt")
+        required = ('name', 'ip')
+        errors = [f"Kamera {i+1}: '{key}' fehlt"
+                  for i, camera in enumerate(config['cameras'])
+                  for key in required if key not in camera]
+        if errors:
+            raise ValueError("; ".join(errors))
     
     def _create_example_config(self):
         """Erstellt eine Beispiel-Konfigurationsdatei"""
@@ -104,7 +164,7 @@ class MultiCameraDownloader:
         }
         
         with open(self.config_file, 'w', encoding='utf-8') as file:
-            yaml.dump(example_config, file, default_flow_style=False, 
+            yaml.dump(example_config, file, Dumper=_YamlDumper, default_flow_style=False, 
                      allow_unicode=True, indent=2)
         
         print(f"Beispiel-Konfiguration erstellt: {self.config_file}")
@@ -113,13 +173,39 @@ class MultiCameraDownloader:
     def _create_directories(self):
         """Erstellt alle benötigten Ordner"""
         base_folder = self.config.get('global_settings', {}).get('base_folder', 'camera_images')
-        Path(base_folder).mkdir(parents=True, exist_ok=True)
+        # Gemeinsamen Basisordner zuerst anlegen, damit die Kamera-Ordner nur noch eine Ebene brauchen
+        os.makedirs(base_folder, exist_ok=True)
         
-        for camera in self.config['cameras']:
-            if camera.get('enabled', True):
-                camera_folder = camera.get('folder', f"camera_{camera['name'].lower().replace(' ', '_')}")
-                full_path = os.path.join(base_folder, camera_folder)
-                Path(full_path).mkdir(parents=True, exist_ok=True)
+        folders = list({self._get_camera_folder(camera) for camera in self.config['cameras']
+                        if camera.get('enabled', True)})
+        if not folders:
+            return
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(4, len(folders))) as executor:
+            for folder_path, recent in zip(folders, executor.map(self._scan_images, folders)):
+                self._recent[folder_path] = recent
+    
+    def _scan_images(self, folder_path):
+        """Legt einen Kamera-Ordner an und liest die vorhandenen Bilder ein (älteste zuerst)"""
+        os.makedirs(folder_path, exist_ok=True)
+        with os.scandir(folder_path) as it:
+            entries = [entry for entry in it
+                       if entry.is_file() and _is_image_name(entry.name)]
+        entries.sort(key=lambda entry: entry.stat().st_ctime)
+        return collections.deque(entry.path for entry in entries)
+    
+    def _create_session(self):
+        """Erstellt eine Session mit Keep-Alive Verbindungspool (eine Verbindung pro Kamera)"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max(1, len(self.config['cameras'])),
+            pool_maxsize=4,
+            max_retries=0
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Keep-Alive'] = 'timeout=60'
+        return session
     
     def _get_camera_url(self, camera):
         """Generiert die vollständige URL für eine Kamera"""
@@ -134,82 +220,158 @@ class MultiCameraDownloader:
     
     def _get_camera_folder(self, camera):
         """Gibt den vollständigen Pfad zum Kamera-Ordner zurück"""
+        ctx = self._ctxs_by_name.get(camera['name'])
+        if ctx is not None:
+            return ctx.folder
+        
         base_folder = self.config.get('global_settings', {}).get('base_folder', 'camera_images')
         camera_folder = camera.get('folder', f"camera_{camera['name'].lower().replace(' ', '_')}")
         return os.path.join(base_folder, camera_folder)
     
-    def _generate_filename(self, camera_name):
+    def _resolve(self, camera):
+        """Löst URL, Ordner und Standardwerte einer Kamera einmalig auf"""
+        global_settings = self.config.get('global_settings', {})
+        return CameraCtx(
+            name=camera['name'],
+            url=self._get_camera_url(camera),
+            folder=self._get_camera_folder(camera),
+            max_images=camera.get('max_images', global_settings.get('max_images', 5)),
+            timeout=camera.get('timeout', global_settings.get('timeout', 10)),
+            interval=self._get_camera_interval(camera),
+            safe_name=camera['name'].lower().translate(_SAFE_MAP)
+        )
+    
+    def _generate_filename(self, safe_name):
         """Generiert einen sinnvollen Dateinamen"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        safe_name = camera_name.lower().replace(' ', '_').replace('ä', 'ae').replace('ö', 'oe').replace('ü', 'ue')
-        return f"{safe_name}_{timestamp}.jpg"
+        sec, ns = divmod(time.time_ns(), 1_000_000_000)
+        timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(sec))
+        return f"{safe_name}_{timestamp}_{ns // 1_000_000:03d}.jpg"
     
-    def _cleanup_old_images(self, folder_path, max_images):
-        """Löscht alte Bilder in einem Ordner"""
-        try:
-            image_files = []
-            for file in os.listdir(folder_path):
-                if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    filepath = os.path.join(folder_path, file)
-                    creation_time = os.path.getctime(filepath)
-                    image_files.append((filepath, creation_time))
-            
-            image_files.sort(key=lambda x: x[1], reverse=True)
-            
-            if len(image_files) >= max_images:
-                files_to_delete = image_files[max_images-1:]
-                for filepath, _ in files_to_delete:
-                    os.remove(filepath)
-                    camera_name = os.path.basename(os.path.dirname(filepath))
-                    print(f"[{camera_name}] Altes Bild gelöscht: {os.path.basename(filepath)}")
-                    
-        except Exception as e:
-            print(f"Fehler beim Aufräumen alter Bilder in {folder_path}: {e}")
+    def _cleanup_old_images(self, folder_path, filepath, max_images):
+        """Merkt sich ein neues Bild und löscht die ältesten über max_images"""
+        recent = self._recent.setdefault(folder_path, collections.deque())
+        recent.append(filepath)
+        
+        while len(recent) > max_images:
+            old_filepath = recent.popleft()
+            try:
+                os.unlink(old_filepath)
+                camera_name = os.path.basename(folder_path)
+                print(f"[{camera_name}] Altes Bild gelöscht: {os.path.basename(old_filepath)}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Fehler beim Aufräumen alter Bilder in {folder_path}: {e}")
     
-    def _download_image_for_camera(self, camera):
+    def _download_image_for_camera(self, ctx):
         """Lädt ein Bild für eine spezifische Kamera herunter"""
         try:
-            url = self._get_camera_url(camera)
-            folder_path = self._get_camera_folder(camera)
-            max_images = camera.get('max_images', 
-                                  self.config.get('global_settings', {}).get('max_images', 5))
-            timeout = camera.get('timeout', 
-                               self.config.get('global_settings', {}).get('timeout', 10))
-            
-            self._cleanup_old_images(folder_path, max_images)
+            # Bedingter GET: unveränderte Bilder liefert die Kamera als 304 ohne Body
+            headers = {}
+            if ctx.last_etag:
+                headers['If-None-Match'] = ctx.last_etag
+            if ctx.last_modified:
+                headers['If-Modified-Since'] = ctx.last_modified
             
-            response = requests.get(url, timeout=timeout)
-            response.raise_for_status()
-            
-            filename = self._generate_filename(camera['name'])
-            filepath = os.path.join(folder_path, filename)
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+            response = self._session.get(ctx.url, timeout=ctx.timeout, stream=True, headers=headers)
+            try:
+                if response.status_code == 304:
+                    print(f"[{ctx.name}] Bild unverändert")
+                    return True
+                
+                response.raise_for_status()
+                
+                filename = self._generate_filename(ctx.safe_name)
+                filepath = os.path.join(ctx.folder, filename)
+                
+                # Body direkt in eine .part-Datei streamen und atomar umbenennen,
+                # damit Leser (push-api) niemals halb geschriebene Bilder sehen
+                tmp_filepath = filepath + '.part'
+                response.raw.decode_content = True
+                try:
+                    fd = os.open(tmp_filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    try:
+                        while True:
+                            chunk = response.raw.read(_WRITE_CHUNK)
+                            if not chunk:
+                                break
+                            # os.write darf kürzer schreiben (Signal, volle SD-Karte) - Rest nachschieben
+                            view = memoryview(chunk)
+                            while view:
+                                written = os.write(fd, view)
+                                view = view[written:]
+                    finally:
+                        os.close(fd)
+                    os.replace(tmp_filepath, filepath)
+                    # Validatoren erst merken, wenn das Bild wirklich auf der Platte liegt -
+                    # sonst bestätigt der nächste 304 ein nie gespeichertes Bild
+                    ctx.last_etag = response.headers.get('ETag')
+                    ctx.last_modified = response.headers.get('Last-Modified')
+                except Exception:
+                    try:
+                        os.unlink(tmp_filepath)
+                    except FileNotFoundError:
+                        pass
+                    raise
+            finally:
+                response.close()
             
-            print(f"[{camera['name']}] Bild gespeichert: {filename}")
+            self._cleanup_old_images(ctx.folder, filepath, ctx.max_images)
+            print(f"[{ctx.name}] Bild gespeichert: {filename}")
             return True
             
         except requests.exceptions.RequestException as e:
-            print(f"[{camera['name']}] Netzwerkfehler: {e}")
+            print(f"[{ctx.name}] Netzwerkfehler: {e}")
             return False
         except Exception as e:
-            print(f"[{camera['name']}] Unerwarteter Fehler: {e}")
+            print(f"[{ctx.name}] Unerwarteter Fehler: {e}")
             return False
     
-    def _camera_download_loop(self, camera):
-        """Download-Schleife für eine einzelne Kamera"""
-        camera_name = camera['name']
-        interval = camera.get('interval', 
-                            self.config.get('global_settings', {}).get('interval', 2))
-        
-        print(f"[{camera_name}] Download-Thread gestartet (Intervall: {interval}s)")
+    def _get_camera_interval(self, camera):
+        """Gibt das Download-Intervall einer Kamera zurück"""
+        return camera.get('interval', 
+                          self.config.get('global_settings', {}).get('interval', 2))
+    
+    def _scheduler_loop(self, ctxs):
+        """Ein Scheduler-Thread für alle Kameras - Downloads laufen im gemeinsamen Pool"""
+        in_flight = {}
+        schedule = []
         
-        while self.running:
-            self._download_image_for_camera(camera)
-            time.sleep(interval)
+        # Absolute Deadlines auf der monotonen Uhr - die Downloaddauer verschiebt den Takt nicht
+        now = time.monotonic()
+        for index, ctx in enumerate(ctxs):
+            print(f"[{ctx.name}] Eingeplant (Intervall: {ctx.interval}s)")
+            heapq.heappush(schedule, (now, index))
         
-        print(f"[{camera_name}] Download-Thread beendet")
+        try:
+            while self.running:
+                delay = schedule[0][0] - time.monotonic()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+                    continue
+                
+                # Alle Kameras, die (fast) gleichzeitig fällig sind, in einem Schwung abschicken
+                now = time.monotonic()
+                batch_until = now + _BATCH_WINDOW
+                while schedule and schedule[0][0] <= batch_until:
+                    due, index = heapq.heappop(schedule)
+                    ctx = ctxs[index]
+                    
+                    # Kamera nicht doppelt abfragen, solange der letzte Download noch läuft
+                    future = in_flight.get(index)
+                    if future is None or future.done():
+                        in_flight[index] = self._executor.submit(self._download_image_for_camera, ctx)
+                    
+                    next_due = due + ctx.interval
+                    if next_due < now - ctx.interval:
+                        # Mehr als ein Intervall im Rückstand: nicht aufholen, sondern neu takten
+                        next_due = now
+                    heapq.heappush(schedule, (next_due, index))
+        finally:
+            # Laufende Downloads noch abschließen lassen
+            concurrent.futures.wait(in_flight.values())
+        
+        print("Scheduler beendet")
     
     def start(self):
         """Startet den Download für alle aktivierten Kameras"""
@@ -223,23 +385,23 @@ class MultiCameraDownloader:
             print("Keine aktivierten Kameras gefunden!")
             return
         
-        print(f"Starte Download für {len(enabled_cameras)} Kamera(s):")
-        for camera in enabled_cameras:
-            url = self._get_camera_url(camera)
-            print(f"  - {camera['name']}: {url}")
+        self._ctxs_by_name = {}
+        self._ctxs = [self._resolve(camera) for camera in enabled_cameras]
+        self._ctxs_by_name = {ctx.name: ctx for ctx in self._ctxs}
+        
+        print(f"Starte Download für {len(self._ctxs)} Kamera(s):")
+        for ctx in self._ctxs:
+            print(f"  - {ctx.name}: {ctx.url}")
         
         self.running = True
-        self.download_threads = []
-        
-        for camera in enabled_cameras:
-            thread = threading.Thread(
-                target=self._camera_download_loop, 
-                args=(camera,),
-                name=f"Camera-{camera['name']}"
-            )
-            thread.daemon = True
-            thread.start()
-            self.download_threads.append(thread)
+        self._stop_event.clear()
+        self.scheduler_thread = threading.Thread(
+            target=self._scheduler_loop,
+            args=(self._ctxs,),
+            name="Camera-Scheduler"
+        )
+        self.scheduler_thread.daemon = True
+        self.scheduler_thread.start()
     
     def stop(self):
         """Stoppt den Download für alle Kameras"""
@@ -249,13 +411,23 @@ class MultiCameraDownloader:
         
         print("Stoppe alle Downloads...")
         self.running = False
+        self._stop_event.set()
         
-        for thread in self.download_threads:
-            thread.join(timeout=5)
+        if self.scheduler_thread:
+            self.scheduler_thread.join(timeout=5)
         
-        self.download_threads = []
+        self.scheduler_thread = None
+        self._session.close()
         print("Alle Downloads gestoppt.")
     
+    def close(self):
+        """Gibt Thread-Pool und Verbindungen frei"""
+        if self.running:
+            self.stop()
+        
+        self._executor.shutdown(wait=True)
+        self._session.close()
+    
     def download_single_all(self):
         """Lädt ein einzelnes Bild von allen aktivierten Kameras herunter"""
         enabled_cameras = [cam for cam in self.config['cameras'] if cam.get('enabled', True)]
@@ -266,11 +438,8 @@ class MultiCameraDownloader:
         
         print(f"Lade Einzelbilder von {len(enabled_cameras)} Kamera(s)...")
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(enabled_cameras)) as executor:
-            futures = [executor.submit(self._download_image_for_camera, camera) 
-                      for camera in enabled_cameras]
-            
-            results = [future.result() for future in concurrent.futures.as_completed(futures)]
+        ctxs = [self._resolve(camera) for camera in enabled_cameras]
+        results = list(self._executor.map(self._download_image_for_camera, ctxs))
         
         successful = sum(results)
         print(f"Erfolgreich: {successful}/{len(enabled_cameras)} Bilder heruntergeladen")
@@ -290,8 +459,10 @@ class MultiCameraDownloader:
             folder_path = self._get_camera_folder(camera)
             image_count = 0
             try:
-                image_count = len([f for f in os.listdir(folder_path) 
-                                 if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
+                with os.scandir(folder_path) as it:
+                    image_count = sum(1 for entry in it
+                                      if entry.is_file(follow_symlinks=False)
+                                      and _is_image_name(entry.name))
             except:
                 pass
             
@@ -301,8 +472,7 @@ class MultiCameraDownloader:
                 "url": self._get_camera_url(camera),
                 "folder": folder_path,
                 "images_count": image_count,
-                "interval": camera.get('interval', 
-                                    self.config.get('global_settings', {}).get('interval', 2))
+                "interval": self._get_camera_interval(camera)
             }
             status["cameras"].append(camera_status)
         
@@ -317,6 +487,7 @@ class MultiCameraDownloader:
             self.stop()
         
         self.config = self._load_config()
+        self._ctxs_by_name = {}
         self._create_directories()
         
         if old_running:
@@ -340,7 +511,7 @@ if __name__ == "__main__":
             
     except KeyboardInterrupt:
         print("\nProgramm wird beendet...")
-        downloader.stop()
+        downloader.close()
 
 
 def create_simple_config(cameras_ips, config_file="simple_config.yaml"):
@@ -373,7 +544,7 @@ def create_simple_config(cameras_ips, config_file="simple_config.yaml"):
         config['cameras'].append(camera)
     
     with open(config_file, 'w', encoding='utf-8') as file:
-        yaml.dump(config, file, default_flow_style=False, allow_unicode=True, indent=2)
+        yaml.dump(config, file, Dumper=_YamlDumper, default_flow_style=False, allow_unicode=True, indent=2)
     
     print(f"Einfache Konfiguration erstellt: {config_file}")
     return config_file
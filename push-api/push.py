@@ -4,11 +4,30 @@ import os
 import time
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import logging
+import hashlib
+import collections
 from datetime import datetime
 import threading
-import glob
+import fnmatch
+import re
+import concurrent.futures
+import contextlib
+import io
+import queue
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,115 +36,249 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def json_dumps(obj) -> bytes:
+    """Serialisiert nach UTF-8 JSON - mit orjson falls installiert"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str).encode('utf-8')
+
+def json_loads(data: bytes):
+    """Parst JSON-Bytes - mit orjson falls installiert"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Identischer Status wird höchstens so oft neu geschrieben (hält den Zeitstempel fürs Dashboard frisch)
+STATUS_REFRESH_SECONDS = 30
+
+# Alle Monitore (Threads) schreiben in dieselbe Historie - Anhängen und Kürzen nie gleichzeitig
+_history_lock = threading.Lock()
+
 class SimpleCompreFaceAPI:
     """Einfacher CompreFace API Client"""
     
-    def __init__(self, api_url: str, api_key: str):
+    def __init__(self, api_url: str, api_key: str, resize_max: int = None):
         self.api_url = api_url.rstrip('/')
         self.api_key = api_key
         self.endpoint = f"{self.api_url}/api/v1/recognition/recognize"
         
+        if resize_max and Image is None:
+            logger.warning("⚠️ Pillow nicht installiert - resize_max wird ignoriert")
+            resize_max = None
+        self.resize_max = resize_max
+        
         self.session = requests.Session()
+        # Genug Verbindungen für parallele Batches mehrerer Kameras - kein Handshake pro Bild
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.1)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
-            'x-api-key': self.api_key
+            'x-api-key': self.api_key,
+            'Connection': 'keep-alive'
         })
     
     def recognize_face(self, image_path: str) -> dict:
         """Schnelle Gesichtserkennung - optimiert für häufige Calls"""
         try:
+            # Bild in einem read() laden und die Datei vor dem Upload schließen
             with open(image_path, 'rb') as f:
-                files = {'file': f}
-                params = {
-                    'det_prob_threshold': 0.75,  
-                    'limit': 2,  
-                    'prediction_count': 1  
-                }
-                
-                response = self.session.post(
-                    self.endpoint,
-                    files=files,
-                    params=params,
-                    timeout=10  
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return {'success': True, 'data': data}
-                elif "No face is found" in response.text:
+                image_data = f.read()
+            
+            if self.resize_max:
+                image_data = self.shrink_image(image_data)
+            
+            files = {'file': (os.path.basename(image_path), image_data, 'image/jpeg')}
+            params = {
+                'det_prob_threshold': 0.75,  
+                'limit': 2,  
+                'prediction_count': 1  
+            }
+            
+            response = self.session.post(
+                self.endpoint,
+                files=files,
+                params=params,
+                timeout=10  
+            )
+            
+            # Leere Szenen (der häufigste Fall) am Rohtext erkennen, ohne JSON zu parsen
+            body = response.content
+            if response.status_code == 200:
+                if b'"result":[]' in body[:64]:
                     return {'success': True, 'data': {'result': []}, 'no_face': True}
-                else:
-                    return {'success': False, 'error': f"HTTP {response.status_code}"}
-                    
+                return {'success': True, 'data': json_loads(body)}
+            elif b"No face is found" in body:
+                return {'success': True, 'data': {'result': []}, 'no_face': True}
+            else:
+                return {'success': False, 'error': f"HTTP {response.status_code}"}
+                
         except requests.exceptions.Timeout:
             return {'success': False, 'error': "Timeout"}
         except Exception as e:
             return {'success': False, 'error': str(e)}
+    
+    def shrink_image(self, image_data: bytes) -> bytes:
+        """Verkleinert übergroße Frames vor dem Upload (weniger Bytes, weniger Server-CPU)"""
+        try:
+            with Image.open(io.BytesIO(image_data)) as img:
+                # .size kommt aus dem Header - kleine Bilder werden gar nicht dekodiert
+                if max(img.size) <= self.resize_max:
+                    return image_data
+                
+                # JPEG direkt in reduzierter Auflösung dekodieren, dann fein skalieren
+                img.draft('RGB', (self.resize_max, self.resize_max))
+                img.thumbnail((self.resize_max, self.resize_max), Image.BILINEAR)
+                
+                buf = io.BytesIO()
+                img.convert('RGB').save(buf, 'JPEG', quality=80, optimize=False)
+                return buf.getvalue()
+        except Exception as e:
+            logger.debug(f"Verkleinern fehlgeschlagen, sende Original: {e}")
+            return image_data
+    
+    def recognize_many(self, image_paths: list, semaphore=None) -> list:
+        """Mehrere Bilder parallel über die gemeinsame Session erkennen - Ergebnisse in Eingabe-Reihenfolge"""
+        limit = semaphore or contextlib.nullcontext()
+        
+        def recognize(image_path):
+            with limit:
+                return self.recognize_face(image_path)
+        
+        if len(image_paths) <= 1:
+            return [recognize(image_path) for image_path in image_paths]
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(image_paths)) as executor:
+            return list(executor.map(recognize, image_paths))
 
 class SimpleCameraMonitor:
     """Einfacher Kamera Monitor"""
     
-    def __init__(self, camera_id: str, config: dict, api: SimpleCompreFaceAPI):
+    def __init__(self, camera_id: str, config: dict, api: SimpleCompreFaceAPI, recog_sema=None):
         self.camera_id = camera_id
         self.config = config
         self.api = api
+        self.recog_sema = recog_sema or contextlib.nullcontext()
         self.folder_path = config['folder_path']
-        self.last_processed = None
+        self._pattern_re = re.compile(fnmatch.translate(config['file_pattern']))
+        self._watermark_ns = 0  # mtime_ns des neuesten verarbeiteten Bildes
+        self._candidate_mtimes = {}
+        self._last_digest = None  # Hash des zuletzt hochgeladenen Bildes
+        self._dir_mtime_ns = None  # Ordner-mtime des letzten vollständig ausgewerteten Scans
+        self._history_appends = 0
+        self._last_status_hash = None
+        self._last_status_write = 0
         
         self.processing_lock = threading.Lock()
         self.is_busy = False
         
+        # Status-Datei wird von einem eigenen Thread geschrieben; die Queue hält nur den neuesten Stand
+        self._status_q = queue.Queue(maxsize=1)
+        self._status_thread = threading.Thread(
+            target=self._status_writer,
+            name=f"Status-{camera_id}",
+            daemon=True
+        )
+        self._status_thread.start()
+        
         logger.info(f"📷 {camera_id} - Monitor gestartet: {self.folder_path}")
     
     def get_newest_images(self, max_count=3):
         """Finde die neuesten unverarbeiteten Bilder - für schnelle Batch-Verarbeitung"""
         try:
-            pattern = os.path.join(self.folder_path, self.config['file_pattern'])
-            files = glob.glob(pattern)
-            
-            if not files:
+            # Neue, umbenannte oder gelöschte Dateien ändern die mtime des Ordners -
+            # ist sie gleich geblieben, gibt es nichts Neues und der Scan entfällt
+            dir_mtime_ns = os.stat(self.folder_path).st_mtime_ns
+            if dir_mtime_ns == self._dir_mtime_ns:
                 return []
             
-            files.sort()
-            
+            match = self._pattern_re.match
+            now = time.time()
             new_files = []
-            last_processed_found = False
+            deferred = False
             
-            for file_path in files:
-                if self.last_processed and file_path == self.last_processed:
-                    last_processed_found = True
-                    continue
-                
-                if not self.last_processed or last_processed_found or file_path > self.last_processed:
-                    file_age = time.time() - os.path.getmtime(file_path)
-                    if file_age >= 0.5 and os.path.getsize(file_path) > 3000:
-                        new_files.append(file_path)
-                        if len(new_files) >= max_count:
-                            break
+            # Ein scandir-Durchlauf: alles bis zum Wasserzeichen fällt sofort raus,
+            # sortiert werden nur die wenigen neuen Kandidaten
+            with os.scandir(self.folder_path) as it:
+                for entry in it:
+                    if not match(entry.name):
+                        continue
+                    
+                    st = entry.stat()
+                    if st.st_mtime_ns <= self._watermark_ns:
+                        continue
+                    if now - st.st_mtime < 0.5:
+                        # Noch zu frisch - beim nächsten Check erneut ansehen
+                        deferred = True
+                    elif st.st_size > 3000:
+                        new_files.append((st.st_mtime_ns, entry.path))
+            
+            new_files.sort()
+            if len(new_files) > max_count:
+                deferred = True
+                new_files = new_files[:max_count]
             
-            return new_files
+            # Ordner-mtime nur merken, wenn kein Kandidat auf später verschoben wurde
+            self._dir_mtime_ns = None if deferred else dir_mtime_ns
+            self._candidate_mtimes = {path: mtime_ns for mtime_ns, path in new_files}
+            return [path for _, path in new_files]
             
         except Exception as e:
             logger.error(f"❌ {self.camera_id} - Fehler beim Suchen: {e}")
             return []
     
-    def process_image(self, image_path: str):
-        """Verarbeite ein Bild mit Live-Status Updates"""
-        filename = os.path.basename(image_path)
+    def is_duplicate_frame(self, image_path: str) -> bool:
+        """Erkennt byte-identische Frames (ESP32 liefert bei Standbild denselben Buffer)"""
+        try:
+            with open(image_path, 'rb') as f:
+                digest = hashlib.blake2b(f.read(), digest_size=8).digest()
+        except OSError:
+            return False
         
-        self.update_live_status('processing', f"🔍 Verarbeite {filename}...", image_file=filename)
+        if digest == self._last_digest:
+            return True
+        self._last_digest = digest
+        return False
+    
+    def process_images(self, image_paths: list):
+        """Verarbeite mehrere Bilder: Erkennung parallel, Status/Historie der Reihe nach"""
+        fresh_paths = [image_path for image_path in image_paths if not self.is_duplicate_frame(image_path)]
+        results = {}
         
-        logger.info(f"🔍 {self.camera_id} - Verarbeite: {filename}")
+        if fresh_paths:
+            filenames = [os.path.basename(image_path) for image_path in fresh_paths]
+            
+            self.update_live_status('processing', f"🔍 Verarbeite {', '.join(filenames)}...", image_file=filenames[-1])
+            
+            logger.info(f"🔍 {self.camera_id} - Verarbeite: {', '.join(filenames)}")
+            
+            start_time = time.perf_counter()
+            results = dict(zip(fresh_paths, self.api.recognize_many(fresh_paths, semaphore=self.recog_sema)))
+            duration = time.perf_counter() - start_time
         
-        start_time = time.time()
-        result = self.api.recognize_face(image_path)
-        duration = time.time() - start_time
+        for image_path in image_paths:
+            if image_path in results:
+                self.handle_result(image_path, results[image_path], duration)
+            else:
+                filename = os.path.basename(image_path)
+                logger.info(f"   ♻️ {self.camera_id} - Doppeltes Bild übersprungen: {filename}")
+                self.update_live_status('gray', "💤 Doppeltes Bild übersprungen", image_file=filename)
+                self.advance_watermark(image_path)
+    
+    def handle_result(self, image_path: str, result: dict, duration: float):
+        """Werte ein Erkennungsergebnis aus und aktualisiere Live-Status und Historie"""
+        filename = os.path.basename(image_path)
+        now = datetime.now()
         
         if result['success']:
             faces = result['data'].get('result', [])
             
             if not faces:
                 logger.info(f"   ❌ {self.camera_id} - Keine Gesichter")
-                self.update_live_status('gray', "💤 Keine Gesichter erkannt", image_file=filename)
+                self.update_live_status('gray', "💤 Keine Gesichter erkannt", image_file=filename, now=now)
             else:
                 recognized = []
                 unknown = 0
@@ -144,110 +297,130 @@ class SimpleCameraMonitor:
                 if recognized:
                     message = f"✅ Erkannt: {', '.join(recognized)}"
                     logger.info(f"   ✅ {self.camera_id} - Erkannt: {', '.join(recognized)}")
-                    self.update_live_status('green', message, recognized=recognized, image_file=filename)
+                    self.update_live_status('green', message, recognized=recognized, image_file=filename, now=now)
                     
                     if unknown > 0:
                         logger.info(f"   👤 {self.camera_id} - Plus {unknown} unbekannt")
                     
-                    self.save_to_history(filename, recognized)
+                    self.save_to_history(filename, recognized, now=now)
                 else:
                     message = f"👤 {unknown} unbekannte Person(en)"
                     logger.info(f"   👤 {self.camera_id} - {unknown} unbekannte Gesichter")
-                    self.update_live_status('red', message, image_file=filename)
+                    self.update_live_status('red', message, image_file=filename, now=now)
         
         else:
             if "Timeout" in result['error']:
                 logger.warning(f"   ⏰ {self.camera_id} - API langsam ({duration:.1f}s)")
-                self.update_live_status('gray', f"⏰ API langsam ({duration:.1f}s)", image_file=filename)
+                self.update_live_status('gray', f"⏰ API langsam ({duration:.1f}s)", image_file=filename, now=now)
             else:
                 logger.error(f"   ❌ {self.camera_id} - Fehler: {result['error']}")
-                self.update_live_status('red', f"❌ API Fehler", image_file=filename)
+                self.update_live_status('red', f"❌ API Fehler", image_file=filename, now=now)
         
         logger.info(f"   ⏱️ {self.camera_id} - Verarbeitung: {duration:.1f}s")
-        self.last_processed = image_path
+        self.advance_watermark(image_path)
     
-    def save_to_history(self, filename: str, recognized: list):
-        """Speichere erfolgreiche Erkennung in Historie"""
-        try:
-            result = {
-                'timestamp': datetime.now().isoformat(),
-                'camera': self.camera_id,
-                'image': filename,
-                'recognized': recognized
-            }
-            
-            results_file = 'recognition_results.json'
-            
-            if os.path.exists(results_file):
-                with open(results_file, 'r') as f:
-                    all_results = json.load(f)
-            else:
-                all_results = []
-            
-            all_results.append(result)
-            
-            if len(all_results) > 50:
-                all_results = all_results[-50:]
-            
-            with open(results_file, 'w') as f:
-                json.dump(all_results, f, indent=2, default=str)
-                
-        except Exception as e:
-            logger.error(f"❌ Fehler beim Speichern der Historie: {e}")
+    def advance_watermark(self, image_path: str):
+        """Markiere ein Bild als verarbeitet"""
+        mtime_ns = self._candidate_mtimes.pop(image_path, None)
+        if mtime_ns is None:
+            try:
+                mtime_ns = os.stat(image_path).st_mtime_ns
+            except OSError:
+                mtime_ns = 0
+        self._watermark_ns = max(self._watermark_ns, mtime_ns)
     
-    def update_live_status(self, status_type, message, recognized=None, image_file=None):
+    def update_live_status(self, status_type, message, recognized=None, image_file=None, now=None):
         """Schreibe JEDEN Status für Web-Frontend (auch rot/grau)"""
         try:
+            # Unveränderten Status nicht erneut schreiben - Zeitstempel zählen dabei nicht mit
+            status_hash = hash((status_type, message, tuple(recognized or ()), image_file))
+            mono_now = time.monotonic()
+            if (status_hash == self._last_status_hash
+                    and mono_now - self._last_status_write < STATUS_REFRESH_SECONDS):
+                return
+            
+            # Ein datetime für Zeitstempel und Uhrzeit
+            now = now or datetime.now()
             live_status = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': now.isoformat(),
                 'camera_id': self.camera_id,
                 'status': status_type,  
                 'message': message,
                 'recognized': recognized or [],
                 'image_file': image_file,
-                'last_check': datetime.now().strftime('%H:%M:%S')
+                'last_check': now.strftime('%H:%M:%S')
             }
             
-            with open('live_status.json', 'w') as f:
-                json.dump(live_status, f, default=str)
+            # Älteren, noch nicht geschriebenen Status verwerfen - nur der neueste zählt
+            try:
+                self._status_q.put_nowait(live_status)
+            except queue.Full:
+                try:
+                    self._status_q.get_nowait()
+                except queue.Empty:
+                    pass
+                self._status_q.put_nowait(live_status)
+            
+            self._last_status_hash = status_hash
+            self._last_status_write = mono_now
                 
         except Exception as e:
             logger.error(f"❌ Fehler beim Schreiben des Live-Status: {e}")
     
-    def save_to_history(self, filename: str, recognized: list):
+    def _status_writer(self):
+        """Schreibt Live-Status im Hintergrund, damit die Erkennung nicht auf das Dateisystem wartet"""
+        while True:
+            live_status = self._status_q.get()
+            try:
+                # Atomar ersetzen: das Dashboard liest nie eine halb geschriebene Datei
+                tmp_file = f"live_status.json.{self.camera_id}.tmp"
+                with open(tmp_file, 'wb') as f:
+                    f.write(json_dumps(live_status))
+                os.replace(tmp_file, 'live_status.json')
+            except Exception as e:
+                logger.error(f"❌ Fehler beim Schreiben des Live-Status: {e}")
+    
+    def save_to_history(self, filename: str, recognized: list, now: datetime = None):
         """Speichere nur erfolgreiche Erkennungen in Historie"""
         try:
             result = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': (now or datetime.now()).isoformat(),
                 'camera': self.camera_id,
                 'image': filename,
                 'recognized': recognized
             }
             
-            results_file = 'recognition_results.json'
+            results_file = 'recognition_results.jsonl'
             
-            if os.path.exists(results_file):
-                with open(results_file, 'r') as f:
-                    all_results = json.load(f)
-            else:
-                all_results = []
-            
-            all_results.append(result)
-            
-            if len(all_results) > 50:
-                all_results = all_results[-50:]
-            
-            with open(results_file, 'w') as f:
-                json.dump(all_results, f, indent=2, default=str)
+            # JSON-Lines: pro Erkennung nur eine Zeile anhängen statt die ganze Datei neu zu schreiben
+            line = json_dumps(result) + b'\n'
+            with _history_lock:
+                with open(results_file, 'ab') as f:
+                    f.write(line)
+                
+                self._history_appends += 1
+                if self._history_appends % 100 == 0:
+                    self.trim_history(results_file)
                 
         except Exception as e:
             logger.error(f"❌ Fehler beim Speichern der Historie: {e}")
     
+    def trim_history(self, results_file: str, keep: int = 50):
+        """Kürze die Historie auf die letzten Einträge (Aufrufer hält _history_lock)"""
+        with open(results_file, 'rb') as f:
+            tail = collections.deque(f, maxlen=keep)
+        
+        tmp_file = f"{results_file}.{self.camera_id}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.writelines(tail)
+        os.replace(tmp_file, results_file)
+    
     def run_loop(self):
         """Schnelle Loop für häufige Checks mit Live-Status Updates"""
         check_interval = self.config.get('check_interval', 1.5)  # Standard: 1.5s
         consecutive_empty = 0
-        last_heartbeat = 0
+        last_heartbeat = float('-inf')
+        self._next_poll = time.monotonic()
         
         logger.info(f"🚀 {self.camera_id} - Turbo-Loop gestartet (Check alle {check_interval}s)")
         
@@ -255,7 +428,8 @@ class SimpleCameraMonitor:
         
         while True:
             try:
-                current_time = time.time()
+                # Monotone Uhr: NTP-Sprünge verschieben weder Heartbeat noch Poll-Takt
+                current_time = time.monotonic()
                 
                 if self.processing_lock.acquire(blocking=False):
                     try:
@@ -267,8 +441,7 @@ class SimpleCameraMonitor:
                             if new_images:
                                 logger.info(f"📦 {self.camera_id} - {len(new_images)} neue Bilder gefunden")
                                 
-                                for image_path in new_images:
-                                    self.process_image(image_path)
+                                self.process_images(new_images)
                                 
                                 consecutive_empty = 0
                             else:
@@ -290,13 +463,17 @@ class SimpleCameraMonitor:
                     logger.debug(f"🔒 {self.camera_id} - Lock belegt")
                 
                 if consecutive_empty == 0:
-                    time.sleep(0.2)
+                    delay = 0.2
                 elif consecutive_empty < 3:
-                    time.sleep(check_interval * 0.3)
+                    delay = check_interval * 0.3
                 elif consecutive_empty < 10:
-                    time.sleep(check_interval)
+                    delay = check_interval
                 else:
-                    time.sleep(check_interval * 1.2)
+                    delay = check_interval * 1.2
+                
+                # Deadline ab Beginn des Checks - die Verarbeitungszeit zählt mit
+                self._next_poll = current_time + delay
+                time.sleep(max(0, self._next_poll - time.monotonic()))
                 
             except KeyboardInterrupt:
                 logger.info(f"🛑 {self.camera_id} - Turbo-Loop beendet")
@@ -314,12 +491,16 @@ class SimpleMonitorSystem:
         self.config = self.load_config(config_file)
         
         api_config = self.config['compreface']
-        self.api = SimpleCompreFaceAPI(api_config['url'], api_config['api_key'])
+        self.api = SimpleCompreFaceAPI(api_config['url'], api_config['api_key'],
+                                       resize_max=api_config.get('resize_max'))
+        
+        # Begrenzt gleichzeitige Erkennungen über alle Kameras, damit CompreFace nicht in Timeouts läuft
+        self._recog_sema = threading.BoundedSemaphore(value=self.config.get('max_inflight', 4))
         
         self.monitors = {}
         for camera_id, camera_config in self.config['cameras'].items():
             if camera_config.get('enabled', True):
-                self.monitors[camera_id] = SimpleCameraMonitor(camera_id, camera_config, self.api)
+                self.monitors[camera_id] = SimpleCameraMonitor(camera_id, camera_config, self.api, self._recog_sema)
         
         logger.info(f"🚀 System initialisiert - {len(self.monitors)} Kameras aktiv")
     
@@ -367,8 +548,12 @@ class SimpleMonitorSystem:
         logger.info("🎯 Drücke Ctrl+C zum Beenden")
         
         try:
-            while True:
-                time.sleep(1)
+            # Monitor-Threads laufen endlos - join blockiert ohne periodisches Aufwachen
+            for thread in threads:
+                thread.join()
+            # Ohne aktive Kamera weiterlaufen wie bisher, statt sofort zu beenden
+            # (start.py würde sonst alle 2s neu starten)
+            threading.Event().wait()
         except KeyboardInterrupt:
             logger.info("🛑 Beende System...")
 
@@ -5,11 +5,14 @@ import time
 import signal
 import sys
 import os
+import queue
 
 class ESP32SystemStarter:
     def __init__(self):
         self.processes = []
         self.running = True
+        # Vom SIGCHLD-Handler befüllt, vom Hauptloop abgearbeitet
+        self._child_events = queue.SimpleQueue()
         self.base_dir = os.path.expanduser("~")  # Home-Verzeichnis
     
     def start_pull_api(self):
@@ -91,8 +94,8 @@ class ESP32SystemStarter:
             push_dir = os.path.join(self.base_dir, 'push-api')
             web_dir = os.path.join(self.base_dir, 'web_dashboard')
             
-            # Links für live_status.json und recognition_results.json
-            files_to_link = ['live_status.json', 'recognition_results.json']
+            # Links für live_status.json und recognition_results.jsonl
+            files_to_link = ['live_status.json', 'recognition_results.jsonl']
             
             for file_name in files_to_link:
                 push_file = os.path.join(push_dir, file_name)
@@ -160,6 +163,11 @@ class ESP32SystemStarter:
         self.stop_all()
         sys.exit(0)
     
+    def _on_child_exit(self, signum, frame):
+        """SIGCHLD: nur Hauptloop wecken - Reaping passiert dort über poll()"""
+        # Kein os.waitpid(-1) - das würde auch fremde Kinder (z.B. subprocess.run) abräumen
+        self._child_events.put(signum)
+    
     def stop_all(self):
         """Stoppe alle Prozesse"""
         self.running = False
@@ -212,6 +220,11 @@ class ESP32SystemStarter:
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         
+        # Beendete Kindprozesse sofort melden statt alle 10s zu pollen
+        has_sigchld = hasattr(signal, 'SIGCHLD')
+        if has_sigchld:
+            signal.signal(signal.SIGCHLD, self._on_child_exit)
+        
         # Starte Pull-API (Kamera Download)
         if not self.start_pull_api():
             print("⚠️ Pull-API konnte nicht gestartet werden - System läuft ohne Kamera-Download")
@@ -267,7 +280,14 @@ class ESP32SystemStarter:
         # Hauptloop - überwache Prozesse
         try:
             while self.running:
-                time.sleep(10)
+                # Blockiert bis ein Kind endet (Fallback ohne SIGCHLD: 10s Poll)
+                try:
+                    self._child_events.get(timeout=None if has_sigchld else 10)
+                except queue.Empty:
+                    pass
+                
+                if not self.running:
+                    break
                 
                 # Prüfe ob Prozesse noch laufen
                 for name, process in self.processes[:]:  # Kopie der Liste
@@ -1,349 +1,542 @@
 #!/usr/bin/env python3
 
-from flask import Flask, render_template_string, jsonify
+# live_status.json wird von push-api atomar ersetzt (tmp-Datei + os.replace).
+# Es gibt also nie eine halb geschriebene Datei - entweder fehlt sie oder sie ist vollständig.
+
+from flask import Flask, Response, request
 import json
 import os
 import time
+import threading
+import re
+import gzip
+import collections
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
 
 app = Flask(__name__)
 
+def json_dumps(obj) -> bytes:
+    """Serialisiert nach UTF-8 JSON - mit orjson falls installiert"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str).encode('utf-8')
+
+def json_dumps_pretty(obj) -> str:
+    """Eingerücktes JSON für die Debug-Seite"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_INDENT_2).decode('utf-8')
+    return json.dumps(obj, indent=2, default=str)
+
+def json_loads(data: bytes):
+    """Parst JSON-Bytes - mit orjson falls installiert"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Geparster Inhalt von live_status.json - nur neu lesen wenn sich die mtime ändert
+_cache_lock = threading.Lock()
+_cached_mtime_ns = None
+_cached_status = None
+_cached_epoch = None
+_cached_time_str = None
+
+@lru_cache(maxsize=8)
+def parse_iso(value: str) -> datetime:
+    """ISO-Zeitstempel parsen - gleicher String liefert dasselbe datetime-Objekt"""
+    return datetime.fromisoformat(value)
+
+def load_live_status():
+    """Lese live_status.json (gecacht) - liefert (status, epoch, time_str)"""
+    global _cached_mtime_ns, _cached_status, _cached_epoch, _cached_time_str
+    
+    st = os.stat('live_status.json')
+    with _cache_lock:
+        if st.st_mtime_ns != _cached_mtime_ns:
+            # Kleine Datei - ein einziger ungepufferter read() statt Python-Dateiobjekt
+            fd = os.open('live_status.json', os.O_RDONLY)
+            try:
+                data = os.read(fd, os.fstat(fd).st_size)
+            finally:
+                os.close(fd)
+            
+            if not data:
+                raise ValueError("live_status.json ist leer")
+            status = json_loads(data)
+            
+            # Zeitstempel einmal pro Dateiänderung umrechnen und formatieren
+            timestamp = parse_iso(status['timestamp'])
+            _cached_epoch = timestamp.timestamp()
+            _cached_time_str = timestamp.strftime('%H:%M:%S')
+            _cached_status = status
+            _cached_mtime_ns = st.st_mtime_ns
+        
+        return _cached_status, _cached_epoch, _cached_time_str
+
+# Antwort ohne (aktuelle) Daten - wird nur gelesen, nie verändert
+FALLBACK_STATUS = {
+    'status': 'gray',
+    'message': "💤 System nicht aktiv",
+    'time': 'N/A',
+    'camera': 'N/A',
+    'image': 'N/A', 
+    'age_minutes': 999,
+    'age_label': 'ALT',
+    'age_class': 'old',
+    'recognized': []
+}
+
+# Grundgerüst der Fehler-Antwort - pro Fehler wird nur die Meldung ergänzt
+ERROR_STATUS_BASE = {
+    'status': 'red',
+    'time': 'ERROR',
+    'camera': 'ERROR',
+    'image': 'ERROR',
+    'age_minutes': 999,
+    'age_label': 'ALT',
+    'age_class': 'old',
+    'recognized': []
+}
+
 def get_latest_status():
     """Hole den aktuellen Live-Status"""
     try:
-        if os.path.exists('live_status.json'):
-            with open('live_status.json', 'r') as f:
-                status = json.load(f)
-            
-            timestamp = datetime.fromisoformat(status['timestamp'])
-            age_minutes = (datetime.now() - timestamp).total_seconds() / 60
-            
-            if age_minutes < 5:  
-                return {
-                    'status': status['status'],  
-                    'message': status['message'],
-                    'time': timestamp.strftime('%H:%M:%S'),
-                    'camera': status.get('camera_id', 'ESP32'),
-                    'image': status.get('image_file', ''),
-                    'age_minutes': int(age_minutes),
-                    'recognized': status.get('recognized', [])
-                }
+        status, epoch, time_str = load_live_status()
         
-        return {
-            'status': 'gray',
-            'message': "💤 System nicht aktiv",
-            'time': 'N/A',
-            'camera': 'N/A',
-            'image': 'N/A', 
-            'age_minutes': 999,
-            'recognized': []
-        }
+        age_minutes = (time.time() - epoch) / 60
         
-    except Exception as e:
-        return {
-            'status': 'red',
-            'message': f"❌ Fehler: {str(e)}",
-            'time': 'ERROR',
-            'camera': 'ERROR',
-            'image': 'ERROR',
-            'age_minutes': 999,
-            'recognized': []
-        }
+        if age_minutes < 5:  
+            age_minutes = int(age_minutes)
+            return {
+                'status': status['status'],  
+                'message': status['message'],
+                'time': time_str,
+                'camera': status.get('camera_id', 'ESP32'),
+                'image': status.get('image_file', ''),
+                'age_minutes': age_minutes,
+                'age_label': 'LIVE' if age_minutes < 1 else f'{age_minutes}min',
+                'age_class': 'fresh' if age_minutes < 2 else 'old',
+                'recognized': status.get('recognized', [])
+            }
+        
+        return FALLBACK_STATUS
+        
+    except FileNotFoundError:
+        return FALLBACK_STATUS
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        # Unlesbare oder unvollständige Datei (z.B. fehlendes Feld) - als Fehler anzeigen
+        return {**ERROR_STATUS_BASE, 'message': f"❌ Fehler: {e}"}
 
-@app.route('/')
-def status_lamp():
-    """Einfache Status-Lampe"""
+# Zuletzt serialisierter Status als (etag, bytes)
+_status_json_cache = (None, None)
+
+def get_status_json():
+    """Aktueller Status als (etag, JSON-Bytes) - pro ETag nur einmal serialisiert"""
+    global _status_json_cache
+    
+    # ETag aus mtime + Alter: neue Datei oder neue Minute ergibt eine neue Antwort
+    try:
+        mtime_ns = os.stat('live_status.json').st_mtime_ns
+    except FileNotFoundError:
+        mtime_ns = 0
     
-    html_template = """
+    status = get_latest_status()
+    etag = f'"{mtime_ns}-{status["status"]}-{status["age_minutes"]}"'
+    
+    cached_etag, body = _status_json_cache
+    if etag != cached_etag:
+        body = json_dumps(status)
+        _status_json_cache = (etag, body)
+    
+    return etag, body
+
+STATUS_CSS = """
+* { 
+    margin: 0; 
+    padding: 0; 
+    box-sizing: border-box; 
+}
+
+body {
+    font-family: 'Arial', sans-serif;
+    background: #1a1a1a;
+    color: white;
+    height: 100vh;
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    overflow: hidden;
+}
+
+.status-container {
+    text-align: center;
+    padding: 40px;
+}
+
+.status-lamp {
+    width: 300px;
+    height: 300px;
+    border-radius: 50%;
+    margin: 0 auto 40px auto;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    font-size: 4em;
+    box-shadow: 0 0 50px rgba(0,0,0,0.5);
+    transition: all 0.5s ease;
+    position: relative;
+}
+
+.status-lamp.green {
+    background: linear-gradient(45deg, #4CAF50, #66BB6A);
+    box-shadow: 0 0 80px rgba(76, 175, 80, 0.6), inset 0 0 50px rgba(255,255,255,0.1);
+    animation: pulse-green 2s infinite;
+}
+
+.status-lamp.red {
+    background: linear-gradient(45deg, #f44336, #e57373);
+    box-shadow: 0 0 80px rgba(244, 67, 54, 0.6), inset 0 0 50px rgba(255,255,255,0.1);
+    animation: pulse-red 2s infinite;
+}
+
+.status-lamp.gray {
+    background: linear-gradient(45deg, #757575, #9E9E9E);
+    box-shadow: 0 0 40px rgba(117, 117, 117, 0.4), inset 0 0 50px rgba(255,255,255,0.1);
+    animation: pulse-gray 3s infinite;
+}
+
+.status-lamp.processing {
+    background: linear-gradient(45deg, #FF9800, #FFB74D);
+    box-shadow: 0 0 80px rgba(255, 152, 0, 0.6), inset 0 0 50px rgba(255,255,255,0.1);
+    animation: pulse-processing 1s infinite;
+}
+
+@keyframes pulse-green {
+    0%, 100% { transform: scale(1); opacity: 1; }
+    50% { transform: scale(1.05); opacity: 0.9; }
+}
+
+@keyframes pulse-red {
+    0%, 100% { transform: scale(1); }
+    25% { transform: scale(1.03); }
+    75% { transform: scale(0.97); }
+}
+
+@keyframes pulse-gray {
+    0%, 100% { opacity: 0.7; }
+    50% { opacity: 1; }
+}
+
+@keyframes pulse-processing {
+    0%, 100% { transform: scale(1); opacity: 0.8; }
+    50% { transform: scale(1.1); opacity: 1; }
+}
+
+.status-message {
+    font-size: 2em;
+    margin-bottom: 20px;
+    font-weight: bold;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.5);
+}
+
+.status-details {
+    font-size: 1.2em;
+    color: #ccc;
+    line-height: 1.6;
+    margin-bottom: 30px;
+}
+
+.status-details div {
+    margin: 5px 0;
+}
+
+.refresh-info {
+    position: fixed;
+    bottom: 20px;
+    left: 50%;
+    transform: translateX(-50%);
+    background: rgba(0,0,0,0.7);
+    padding: 10px 20px;
+    border-radius: 20px;
+    font-size: 0.9em;
+    color: #ccc;
+}
+
+.time-badge {
+    position: fixed;
+    top: 20px;
+    right: 20px;
+    background: rgba(0,0,0,0.7);
+    padding: 10px 20px;
+    border-radius: 20px;
+    font-size: 1.1em;
+}
+
+.camera-badge {
+    position: fixed;
+    top: 20px;
+    left: 20px;
+    background: rgba(0,0,0,0.7);
+    padding: 10px 20px;
+    border-radius: 20px;
+    font-size: 1.1em;
+}
+
+.age-indicator {
+    position: absolute;
+    bottom: -10px;
+    right: -10px;
+    background: rgba(255,255,255,0.2);
+    color: white;
+    padding: 5px 10px;
+    border-radius: 15px;
+    font-size: 0.8em;
+    font-weight: bold;
+}
+
+.age-indicator.fresh {
+    background: rgba(76, 175, 80, 0.8);
+}
+
+.age-indicator.old {
+    background: rgba(244, 67, 54, 0.8);
+}
+
+@media (max-width: 768px) {
+    .status-lamp {
+        width: 250px;
+        height: 250px;
+        font-size: 3em;
+    }
+
+    .status-message {
+        font-size: 1.5em;
+    }
+
+    .status-details {
+        font-size: 1em;
+    }
+
+    .time-badge, .camera-badge {
+        position: static;
+        margin: 10px auto;
+        display: inline-block;
+    }
+}
+"""
+
+SHELL_HTML = """
     <!DOCTYPE html>
     <html lang="de">
     <head>
         <meta charset="UTF-8">
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <title>ESP32 Status</title>
-        <style>
-            * { 
-                margin: 0; 
-                padding: 0; 
-                box-sizing: border-box; 
-            }
-            
-            body {
-                font-family: 'Arial', sans-serif;
-                background: #1a1a1a;
-                color: white;
-                height: 100vh;
-                display: flex;
-                flex-direction: column;
-                justify-content: center;
-                align-items: center;
-                overflow: hidden;
-            }
-            
-            .status-container {
-                text-align: center;
-                padding: 40px;
-            }
-            
-            .status-lamp {
-                width: 300px;
-                height: 300px;
-                border-radius: 50%;
-                margin: 0 auto 40px auto;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                font-size: 4em;
-                box-shadow: 0 0 50px rgba(0,0,0,0.5);
-                transition: all 0.5s ease;
-                position: relative;
-            }
-            
-            .status-lamp.green {
-                background: linear-gradient(45deg, #4CAF50, #66BB6A);
-                box-shadow: 0 0 80px rgba(76, 175, 80, 0.6), inset 0 0 50px rgba(255,255,255,0.1);
-                animation: pulse-green 2s infinite;
-            }
-            
-            .status-lamp.red {
-                background: linear-gradient(45deg, #f44336, #e57373);
-                box-shadow: 0 0 80px rgba(244, 67, 54, 0.6), inset 0 0 50px rgba(255,255,255,0.1);
-                animation: pulse-red 2s infinite;
-            }
-            
-            .status-lamp.gray {
-                background: linear-gradient(45deg, #757575, #9E9E9E);
-                box-shadow: 0 0 40px rgba(117, 117, 117, 0.4), inset 0 0 50px rgba(255,255,255,0.1);
-                animation: pulse-gray 3s infinite;
-            }
-            
-            .status-lamp.processing {
-                background: linear-gradient(45deg, #FF9800, #FFB74D);
-                box-shadow: 0 0 80px rgba(255, 152, 0, 0.6), inset 0 0 50px rgba(255,255,255,0.1);
-                animation: pulse-processing 1s infinite;
-            }
-            
-            @keyframes pulse-green {
-                0%, 100% { transform: scale(1); opacity: 1; }
-                50% { transform: scale(1.05); opacity: 0.9; }
-            }
-            
-            @keyframes pulse-red {
-                0%, 100% { transform: scale(1); }
-                25% { transform: scale(1.03); }
-                75% { transform: scale(0.97); }
-            }
-            
-            @keyframes pulse-gray {
-                0%, 100% { opacity: 0.7; }
-                50% { opacity: 1; }
-            }
-            
-            @keyframes pulse-processing {
-                0%, 100% { transform: scale(1); opacity: 0.8; }
-                50% { transform: scale(1.1); opacity: 1; }
-            }
-            
-            .status-message {
-                font-size: 2em;
-                margin-bottom: 20px;
-                font-weight: bold;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.5);
-            }
-            
-            .status-details {
-                font-size: 1.2em;
-                color: #ccc;
-                line-height: 1.6;
-                margin-bottom: 30px;
-            }
-            
-            .status-details div {
-                margin: 5px 0;
-            }
-            
-            .refresh-info {
-                position: fixed;
-                bottom: 20px;
-                left: 50%;
-                transform: translateX(-50%);
-                background: rgba(0,0,0,0.7);
-                padding: 10px 20px;
-                border-radius: 20px;
-                font-size: 0.9em;
-                color: #ccc;
-            }
-            
-            .time-badge {
-                position: fixed;
-                top: 20px;
-                right: 20px;
-                background: rgba(0,0,0,0.7);
-                padding: 10px 20px;
-                border-radius: 20px;
-                font-size: 1.1em;
-            }
-            
-            .camera-badge {
-                position: fixed;
-                top: 20px;
-                left: 20px;
-                background: rgba(0,0,0,0.7);
-                padding: 10px 20px;
-                border-radius: 20px;
-                font-size: 1.1em;
-            }
-            
-            .age-indicator {
-                position: absolute;
-                bottom: -10px;
-                right: -10px;
-                background: rgba(255,255,255,0.2);
-                color: white;
-                padding: 5px 10px;
-                border-radius: 15px;
-                font-size: 0.8em;
-                font-weight: bold;
-            }
-            
-            .age-indicator.fresh {
-                background: rgba(76, 175, 80, 0.8);
-            }
-            
-            .age-indicator.old {
-                background: rgba(244, 67, 54, 0.8);
-            }
-            
-            @media (max-width: 768px) {
-                .status-lamp {
-                    width: 250px;
-                    height: 250px;
-                    font-size: 3em;
-                }
-                
-                .status-message {
-                    font-size: 1.5em;
-                }
-                
-                .status-details {
-                    font-size: 1em;
-                }
-                
-                .time-badge, .camera-badge {
-                    position: static;
-                    margin: 10px auto;
-                    display: inline-block;
-                }
-            }
-        </style>
+        <link rel="stylesheet" href="/style.css">
     </head>
     <body>
-        <div class="camera-badge">📷 {{ status.camera }}</div>
-        <div class="time-badge">🕐 {{ status.time }}</div>
+        <div class="camera-badge" id="camera"></div>
+        <div class="time-badge" id="time"></div>
         
         <div class="status-container">
-            <div class="status-lamp {{ status.status }}">
-                {% if status.status == 'green' %}
-                    ✅
-                {% elif status.status == 'red' %}
-                    ❌
-                {% elif status.status == 'processing' %}
-                    🔍
-                {% else %}
-                    💤
-                {% endif %}
-                
-                <div class="age-indicator {{ 'fresh' if status.age_minutes < 2 else 'old' }}">
-                    {% if status.age_minutes < 1 %}
-                        LIVE
-                    {% elif status.age_minutes < 5 %}
-                        {{ status.age_minutes }}min
-                    {% else %}
-                        ALT
-                    {% endif %}
-                </div>
+            <div class="status-lamp" id="lamp">
+                <span id="lamp-icon"></span>
+                <div class="age-indicator" id="age"></div>
             </div>
             
-            <div class="status-message">
-                {{ status.message }}
-            </div>
+            <div class="status-message" id="message"></div>
             
-            <div class="status-details">
-                {% if status.age_minutes < 5 %}
-                    {% if status.recognized %}
-                        <div>👥 {{ status.recognized | join(', ') }}</div>
-                    {% endif %}
-                    <div>🕐 Vor {{ status.age_minutes }} Minute(n)</div>
-                    {% if status.image != 'N/A' %}
-                        <div>📁 {{ status.image }}</div>
-                    {% endif %}
-                {% else %}
-                    <div>⏰ Keine aktuellen Daten</div>
-                    <div>🔍 System möglicherweise nicht aktiv</div>
-                {% endif %}
-            </div>
+            <div class="status-details" id="details"></div>
         </div>
         
         <div class="refresh-info">
-            🔄 Aktualisiert alle 2 Sekunden | Status: {{ status.status.upper() }}
+            🔄 Aktualisiert alle 2 Sekunden | Status: <span id="state"></span>
         </div>
         
         <script>
-            // Auto-Refresh alle 2 Sekunden (schneller für Live-Updates)
-            setTimeout(function() {
-                window.location.reload();
-            }, 2000);
+            // Startzustand kommt als JSON mit der Seite, danach alle 2 Sekunden /api/status holen und nur die Elemente anpassen
+            window.__STATUS__ = __BOOT__;
+            const ICONS = {green: '✅', red: '❌', processing: '🔍'};
+            const byId = (id) => document.getElementById(id);
+            
+            function addLine(parent, text) {
+                const div = document.createElement('div');
+                div.textContent = text;
+                parent.appendChild(div);
+            }
+            
+            function render(s) {
+                byId('camera').textContent = '📷 ' + s.camera;
+                byId('time').textContent = '🕐 ' + s.time;
+                byId('lamp').className = 'status-lamp ' + s.status;
+                byId('lamp-icon').textContent = ICONS[s.status] || '💤';
+                
+                const age = byId('age');
+                age.className = 'age-indicator ' + s.age_class;
+                age.textContent = s.age_label;
+                
+                byId('message').textContent = s.message;
+                
+                const details = byId('details');
+                details.replaceChildren();
+                if (s.age_minutes < 5) {
+                    if (s.recognized && s.recognized.length) addLine(details, '👥 ' + s.recognized.join(', '));
+                    addLine(details, '🕐 Vor ' + s.age_minutes + ' Minute(n)');
+                    if (s.image !== 'N/A') addLine(details, '📁 ' + s.image);
+                } else {
+                    addLine(details, '⏰ Keine aktuellen Daten');
+                    addLine(details, '🔍 System möglicherweise nicht aktiv');
+                }
+                
+                byId('state').textContent = s.status.toUpperCase();
+            }
+            
+            let timer = null;
+            let lastEtag = null;
+            
+            async function tick() {
+                // Versteckter Tab: nicht pollen, beim Zurückkehren geht es sofort weiter
+                if (document.hidden) {
+                    timer = null;
+                    return;
+                }
+                try {
+                    // Unveränderter Status kommt als 304 ohne Body zurück - dann nichts anfassen
+                    const r = await fetch('/api/status', {headers: lastEtag ? {'If-None-Match': lastEtag} : {}});
+                    if (r.status === 200) {
+                        lastEtag = r.headers.get('ETag');
+                        render(await r.json());
+                    }
+                } catch (e) {
+                    // Server kurz weg - beim nächsten Tick erneut versuchen
+                }
+                timer = document.hidden ? null : setTimeout(tick, 2000);
+            }
+            
+            document.addEventListener('visibilitychange', function() {
+                if (!document.hidden && timer === null) tick();
+            });
+            
+            render(window.__STATUS__);
+            timer = setTimeout(tick, 2000);
         </script>
     </body>
     </html>
-    """
+"""
+
+def minify_css(css: str) -> str:
+    """Einfaches CSS-Minify - reicht, da das Stylesheet keine Kommentare oder Strings mit Leerzeichen hat"""
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};:,])\s*', r'\1', css).replace(';}', '}').strip()
+
+# CSS einmalig minifizieren und vorkomprimieren - wird vom Browser gecacht
+STYLE_CSS = minify_css(STATUS_CSS).encode('utf-8')
+STYLE_CSS_GZ = gzip.compress(STYLE_CSS, compresslevel=9, mtime=0)
+
+# Einrückung entfernen - Zeilenumbrüche bleiben, damit JS-Kommentare gültig bleiben
+SHELL_HTML = re.sub(r'\n\s+', '\n', SHELL_HTML).strip()
+
+@app.route('/')
+def status_lamp():
+    """Einfache Status-Lampe"""
+    # Kein Jinja: statische Seite, Status als JSON-Insel ('<' escapen, damit kein </script> entstehen kann)
+    _, body = get_status_json()
+    boot = body.decode('utf-8').replace('<', '\\u003c')
     
-    status = get_latest_status()
+    return SHELL_HTML.replace('__BOOT__', boot)
+
+@app.route('/style.css')
+def style_css():
+    """Stylesheet der Status-Lampe (gzip wenn der Browser es kann)"""
+    headers = {'Cache-Control': 'public, max-age=3600', 'Vary': 'Accept-Encoding'}
     
-    return render_template_string(html_template, status=status)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        return Response(STYLE_CSS_GZ, mimetype='text/css', headers=headers)
+    
+    return Response(STYLE_CSS, mimetype='text/css', headers=headers)
 
 @app.route('/api/status')
 def api_status():
     """API für aktuellen Status"""
-    return jsonify(get_latest_status())
+    etag, body = get_status_json()
+    
+    # Kurz cachebar: ein Proxy davor fasst gleichzeitige Polls vieler Clients zusammen
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=1'}
+    
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers=headers)
+    
+    return Response(body, mimetype='application/json', headers=headers)
+
+# Debug-Seite höchstens einmal pro Sekunde neu aufbauen
+DEBUG_CACHE_SECONDS = 1.0
+_debug_cache = (0.0, None)
 
 @app.route('/debug')
 def debug_info():
     """Debug-Seite für Entwicklung"""
+    global _debug_cache
+    
+    cached_at, page = _debug_cache
+    now = time.monotonic()
+    if page is not None and now - cached_at < DEBUG_CACHE_SECONDS:
+        return page
+    
     debug_data = {}
     
     try:
-        if os.path.exists('live_status.json'):
-            with open('live_status.json', 'r') as f:
-                debug_data['live_status'] = json.load(f)
-        else:
-            debug_data['live_status'] = "Datei nicht gefunden"
+        debug_data['live_status'] = load_live_status()[0]
+    except FileNotFoundError:
+        debug_data['live_status'] = "Datei nicht gefunden"
     except Exception as e:
         debug_data['live_status'] = f"Fehler: {e}"
     
     try:
-        if os.path.exists('recognition_results.json'):
-            with open('recognition_results.json', 'r') as f:
-                results = json.load(f)
-                debug_data['history_count'] = len(results)
-                debug_data['last_3_results'] = results[-3:] if len(results) >= 3 else results
-        else:
-            debug_data['history'] = "Datei nicht gefunden"
+        # Nur die letzten 3 Zeilen parsen, der Rest wird nur gezählt
+        tail = collections.deque(maxlen=3)
+        count = 0
+        with open('recognition_results.jsonl', 'rb') as f:
+            for line in f:
+                if line.strip():
+                    tail.append(line)
+                    count += 1
+        debug_data['history_count'] = count
+        debug_data['last_3_results'] = [json_loads(line) for line in tail]
+    except FileNotFoundError:
+        debug_data['history'] = "Datei nicht gefunden"
     except Exception as e:
         debug_data['history'] = f"Fehler: {e}"
     
     debug_data['current_time'] = datetime.now().isoformat()
-    debug_data['files_exist'] = {
-        'live_status.json': os.path.exists('live_status.json'),
-        'recognition_results.json': os.path.exists('recognition_results.json'),
-        'api-config.yaml': os.path.exists('api-config.yaml')
-    }
+    # Ein stat() pro Datei - liefert Existenz und Alter zugleich
+    stats = {}
+    for file_name in ('live_status.json', 'recognition_results.jsonl', 'api-config.yaml'):
+        try:
+            stats[file_name] = os.stat(file_name)
+        except OSError:
+            stats[file_name] = None
+    
+    debug_data['files_exist'] = {name: st is not None for name, st in stats.items()}
     
-    if os.path.exists('live_status.json'):
-        stat = os.stat('live_status.json')
-        debug_data['live_status_age'] = int((time.time() - stat.st_mtime) / 60)  # Minuten
+    live_stat = stats['live_status.json']
+    if live_stat is not None:
+        debug_data['live_status_age'] = int((time.time() - live_stat.st_mtime) / 60)  # Minuten
     
-    return f"<pre>{json.dumps(debug_data, indent=2, default=str)}</pre>"
+    page = f"<pre>{json_dumps_pretty(debug_data)}</pre>"
+    _debug_cache = (now, page)
+    return page
 
 if __name__ == '__main__':
     print("🚨 ESP32 Status Lampe - LIVE VERSION")
@@ -361,4 +554,9 @@ if __name__ == '__main__':
     print("📡 Liest live_status.json für sofortige Updates")
     print("=" * 40)
     
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # Produktions-WSGI-Server falls installiert, sonst Flask-Server mit Threads
+    if serve is not None:
+        print("🧵 Server: waitress (8 Threads)")
+        serve(app, host='0.0.0.0', port=5000, threads=8)
+    else:
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)